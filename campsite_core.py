@@ -0,0 +1,521 @@
+"""Configuration, the Playwright checker and the polling loop shared by the command-line script and the FastAPI service."""
+import asyncio
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import os
+import shutil
+import json
+import hashlib
+import random
+import orjson
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dotenv import load_dotenv
+import httpx
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError, TargetClosedError
+
+# --- CONFIGURATION ---
+# Load environment variables from a .env file in the same directory
+load_dotenv()
+
+# Retrieve configuration from environment variables
+TARGET_URL = os.getenv("TARGET_URL")
+# Optional: a comma-separated list of reservation URLs to check together instead of TARGET_URL.
+TARGET_URLS = [url.strip() for url in os.getenv("TARGET_URLS", TARGET_URL or "").split(",") if url.strip()]
+PUSHOVER_API_TOKEN = os.getenv("PUSHOVER_API_TOKEN")
+PUSHOVER_USER_KEY = os.getenv("PUSHOVER_USER_KEY")
+
+# Optional: when set, the public availability API is checked before launching a browser.
+# It is only used when TARGET_URLS holds a single URL for this campground.
+CAMPGROUND_ID = os.getenv("CAMPGROUND_ID")
+ARRIVAL_DATE = os.getenv("ARRIVAL_DATE")  # YYYY-MM-DD
+DEPARTURE_DATE = os.getenv("DEPARTURE_DATE")  # YYYY-MM-DD, defaults to the day after arrival
+# The time zone the peak booking hours below are in. Containers usually run on UTC, so this is not the system clock.
+PEAK_TIMEZONE = os.getenv("PEAK_TIMEZONE", "America/Toronto")
+
+# --- SCRIPT SETTINGS ---
+CHECK_INTERVAL_SECONDS = 5
+# The interval doubles after each failed check and resets after a successful one. No wait exceeds this cap,
+# jitter included, unless the server asks for longer with Retry-After.
+MAX_BACKOFF_SECONDS = 300
+# High enough that a sustained outage backs off to MAX_BACKOFF_SECONDS for a while before the script gives up.
+MAX_CONSECUTIVE_FAILURES = 10
+# Outside these hours in PEAK_TIMEZONE, checks run OFF_PEAK_MULTIPLIER times less often.
+PEAK_START_HOUR = 6
+PEAK_END_HOUR = 22
+OFF_PEAK_MULTIPLIER = 12
+# Set to False to see the browser window, or True to run in the background.
+HEADLESS_MODE = True
+# The browser is kept open between checks and relaunched after this many uses to keep memory in check.
+BROWSER_RECYCLE_AFTER = 50
+# Resolved once at import. A Chrome already installed on the machine (as in the container) is used directly;
+# otherwise Playwright falls back to the Chromium build from `playwright install`.
+CHROME_PATH = shutil.which("google-chrome") or shutil.which("chromium") or shutil.which("chromium-browser")
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36'
+# At most this many pages are open at once when checking several URLs.
+BROWSER_POOL_SIZE = 3
+# Requests the availability check never needs. Stylesheets are kept because the visibility checks depend on them.
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_URL_PARTS = ("googletagmanager", "google-analytics")
+
+# --- AVAILABILITY API PROBE ---
+def _stay_nights():
+    """Returns each night of the configured stay as YYYY-MM-DD, or an empty list if the dates are unusable."""
+    try:
+        arrival = date.fromisoformat(ARRIVAL_DATE)
+        departure = date.fromisoformat(DEPARTURE_DATE) if DEPARTURE_DATE else arrival + timedelta(days=1)
+    except ValueError:
+        print("ARRIVAL_DATE and DEPARTURE_DATE in the .env file must be YYYY-MM-DD. Skipping the availability API.")
+        return []
+    if departure <= arrival:
+        print("DEPARTURE_DATE in the .env file must be after ARRIVAL_DATE. Skipping the availability API.")
+        return []
+    return [(arrival + timedelta(days=i)).isoformat() for i in range((departure - arrival).days)]
+
+
+# Every night of the stay must be open on the same campsite for it to count as available.
+STAY_NIGHTS = _stay_nights() if CAMPGROUND_ID and ARRIVAL_DATE else []
+if STAY_NIGHTS:
+    AVAILABILITY_API_URL = f"https://www.recreation.gov/api/camps/availability/campground/{CAMPGROUND_ID}/month"
+    # The API returns one month per request, so a stay across a month boundary needs more than one.
+    AVAILABILITY_API_MONTHS = sorted({f"{night[:7]}-01T00:00:00.000Z" for night in STAY_NIGHTS})
+else:
+    AVAILABILITY_API_URL = None
+    AVAILABILITY_API_MONTHS = []
+# ETag / Last-Modified and the parsed result of each month are kept here so unchanged data can be skipped across restarts.
+PROBE_CACHE_FILE = "/tmp/probe_cache.json"
+# The last status of each page (and of the API probe) with a fingerprint of what was found, so the same open
+# sites aren't reported twice.
+FINGERPRINT_FILE = "/tmp/last_fp"
+
+# --- ROBUST LOCATORS ---
+PAGE_LOAD_CONFIRMATION_ID = "arrival-date-field" # The ID of the main search form
+LIST_VIEW_BUTTON_ID = "list-view-button-button"        # The unique ID of the 'List' button
+NO_SITES_MESSAGE_XPATH = "//h2[contains(text(), 'No Available Sites')]" # A content-based XPath
+# The checker waits for either this or the 'No Available Sites' message, whichever renders first.
+SITE_LISTING_SELECTOR = '[data-component="campsite-list-item"]'
+RESULTS_LIST_SELECTOR = "#search-results-list"
+
+# Reused across checks so the connection to the API stays open between polls.
+_API_SESSION = requests.Session()
+_API_SESSION.headers.update({"User-Agent": USER_AGENT, "Accept": "application/json"})
+_API_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=2, pool_maxsize=4,
+    # Retry-After is honoured by the polling schedule instead of by sleeping inside a request.
+    max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504],
+                      respect_retry_after_header=False, raise_on_status=False),
+))
+# Seconds the API last asked us to wait through a Retry-After header, used once by next_check_delay().
+_retry_after = None
+
+PUSHOVER_API_URL = "https://api.pushover.net/1/messages.json"
+# Reused for every notification so the TLS connection to Pushover stays open.
+_PUSHOVER_CLIENT = httpx.AsyncClient(
+    timeout=10,
+    # httpx only retries failed connection attempts, never requests that reached the server.
+    transport=httpx.AsyncHTTPTransport(retries=2, limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)),
+)
+
+
+async def send_pushover_notification(message, title="Campsite Available!", url=None):
+    """Sends a notification to your device via the Pushover service."""
+    if not PUSHOVER_API_TOKEN or not PUSHOVER_USER_KEY:
+        print("Pushover credentials are not set in the .env file. Skipping notification.")
+        return
+    try:
+        payload = {
+            "token": PUSHOVER_API_TOKEN, "user": PUSHOVER_USER_KEY,
+            "message": message, "title": title, "priority": 1
+        }
+        if "book it now" in message:
+            payload["url"], payload["url_title"] = url or TARGET_URL, "Book Now!"
+        response = await _PUSHOVER_CLIENT.post(PUSHOVER_API_URL, data=payload)
+        if response.status_code == 200:
+            print("Notification sent successfully!")
+        else:
+            print(f"Failed to send notification. Status: {response.status_code}, Response: {response.text}")
+    except httpx.HTTPError as e:
+        print(f"An error occurred while sending the Pushover notification: {e}")
+
+
+async def close_notifier():
+    """Closes the shared Pushover client. Call once no more notifications will be sent."""
+    await _PUSHOVER_CLIENT.aclose()
+
+
+def _load_probe_cache():
+    """Loads the validators and results saved by the previous probe, if it was for the same query."""
+    try:
+        with open(PROBE_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("url") != AVAILABILITY_API_URL or cache.get("nights") != STAY_NIGHTS:
+        return {}
+    return cache
+
+
+def _save_probe_cache(months):
+    cache = {
+        "url": AVAILABILITY_API_URL,
+        "nights": STAY_NIGHTS,
+        "months": months,
+    }
+    try:
+        with open(PROBE_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"Could not save the probe cache: {e}")
+
+
+def _available_nights(data):
+    """Maps each campsite ID to the stay nights it is available for in one month of API data."""
+    nights = {}
+    for campsite_id, campsite in data.get("campsites", {}).items():
+        for day, availability in campsite.get("availabilities", {}).items():
+            # Keys look like "2024-07-01T00:00:00Z".
+            if availability == "Available" and day[:10] in STAY_NIGHTS:
+                nights.setdefault(campsite_id, set()).add(day[:10])
+    return nights
+
+
+def _note_retry_after(response):
+    """Remembers a Retry-After header (in seconds or as an HTTP date) so the next wait honours it."""
+    global _retry_after
+    value = response.headers.get("Retry-After")
+    if not value:
+        return
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return
+    _retry_after = max(seconds, 0)
+
+
+def fast_probe():
+    """
+    Checks the availability API directly before resorting to the browser.
+    Returns a status string, or None if the probe could not tell and the browser should be used.
+    """
+    if not AVAILABILITY_API_URL or not STAY_NIGHTS:
+        return None
+
+    cached_months = _load_probe_cache().get("months", {})
+
+    try:
+        print("Probing availability API...")
+        # A campsite can be open on nights spread across months, so every month is needed to decide.
+        months = {}
+        for start_date in AVAILABILITY_API_MONTHS:
+            cached = cached_months.get(start_date)
+            headers = {}
+            if cached and cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached and cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+            response = _API_SESSION.get(AVAILABILITY_API_URL, params={"start_date": start_date}, headers=headers, timeout=10)
+            _note_retry_after(response)
+            if response.status_code == 304 and cached:
+                print(f"Availability for {start_date[:7]} has not changed since the last check.")
+                months[start_date] = cached
+                continue
+            response.raise_for_status()
+            months[start_date] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "available": {
+                    campsite_id: sorted(nights)
+                    for campsite_id, nights in _available_nights(orjson.loads(response.content)).items()
+                },
+            }
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
+        print(f"Availability probe failed: {e}. Falling back to the browser.")
+        return None
+
+    available = {}
+    for month in months.values():
+        for campsite_id, nights in month["available"].items():
+            available.setdefault(campsite_id, set()).update(nights)
+    _save_probe_cache(months)
+    fingerprint = _fingerprint(orjson.dumps({campsite_id: sorted(nights) for campsite_id, nights in available.items()}, option=orjson.OPT_SORT_KEYS).decode())
+    if not any(len(nights) == len(STAY_NIGHTS) for nights in available.values()):
+        print("No sites available according to the availability API.")
+        _remember_status(AVAILABILITY_API_URL, fingerprint, 'SUCCESS_NOT_FOUND')
+        return 'SUCCESS_NOT_FOUND'
+    status = _found_status(AVAILABILITY_API_URL, fingerprint)
+    if status == 'SUCCESS_UNCHANGED':
+        print("Sites are still available according to the availability API; they were already reported.")
+    else:
+        print("SITES FOUND via the availability API!")
+    return status
+
+
+def _load_fingerprints():
+    try:
+        with open(FINGERPRINT_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+LAST_FINGERPRINTS = _load_fingerprints()
+
+
+def _fingerprint(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _remember_status(key, fingerprint, status):
+    """Saves the status a check produced, with the fingerprint of what was found, for the next check of this key."""
+    LAST_FINGERPRINTS[key] = {"fingerprint": fingerprint, "status": status}
+    try:
+        with open(FINGERPRINT_FILE, "w") as f:
+            json.dump(LAST_FINGERPRINTS, f)
+    except OSError as e:
+        print(f"Could not save the results fingerprint: {e}")
+
+
+def _found_status(key, fingerprint):
+    """
+    Returns 'SUCCESS_UNCHANGED' if the same open sites were already reported for this key, otherwise 'SUCCESS_FOUND'.
+    A check without a fingerprint always counts as a new find.
+    """
+    previous = LAST_FINGERPRINTS.get(key) or {}
+    if fingerprint is not None and previous.get("status") == 'SUCCESS_FOUND' and previous.get("fingerprint") == fingerprint:
+        return 'SUCCESS_UNCHANGED'
+    _remember_status(key, fingerprint, 'SUCCESS_FOUND')
+    return 'SUCCESS_FOUND'
+
+
+def _peak_zone():
+    try:
+        return ZoneInfo(PEAK_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"PEAK_TIMEZONE '{PEAK_TIMEZONE}' in the .env file is not a known time zone. Using the system clock instead.")
+        return None
+
+
+_PEAK_ZONE = _peak_zone()
+
+
+def next_check_delay(consecutive_failures):
+    """
+    Returns how many seconds to wait before the next check: longer off-peak, doubled per consecutive
+    failure, plus up to 30% jitter, capped at MAX_BACKOFF_SECONDS, and never shorter than a pending Retry-After.
+    """
+    global _retry_after
+    if PEAK_START_HOUR <= datetime.now(_PEAK_ZONE).hour < PEAK_END_HOUR:
+        base = CHECK_INTERVAL_SECONDS
+    else:
+        base = CHECK_INTERVAL_SECONDS * OFF_PEAK_MULTIPLIER
+    interval = base * 2 ** consecutive_failures
+    interval = min(interval + random.uniform(0, 0.3 * interval), MAX_BACKOFF_SECONDS)
+    if _retry_after is not None:
+        interval = max(interval, _retry_after)
+        _retry_after = None
+    return interval
+
+
+async def _block_unneeded_requests(route):
+    """Aborts images, fonts, media and analytics so each page load only fetches what the check uses."""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(part in request.url for part in BLOCKED_URL_PARTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def _results_fingerprint(page):
+    """Returns a short hash of the results list text, or None if the list could not be read."""
+    results_list = page.locator(RESULTS_LIST_SELECTOR)
+    # count() doesn't wait, so a page without the list costs nothing extra.
+    if await results_list.count() == 0:
+        return None
+    return _fingerprint(await results_list.first.inner_text())
+
+
+async def _save_error_screenshot(page):
+    """Saves a screenshot for debugging; a failure here must not mask the original error."""
+    if page is None:
+        return
+    try:
+        await page.screenshot(path="error_screenshot.png")
+    except PlaywrightError as e:
+        print(f"Could not save an error screenshot: {e}")
+
+
+class Checker:
+    """
+    Keeps a single Playwright browser open across checks and shares it between concurrent pages.
+    Each check gets a fresh context, so no cookies or storage carry over between polls.
+    """
+
+    def __init__(self):
+        self._pw = None
+        self._browser = None
+        self._uses = 0
+        self._semaphore = asyncio.Semaphore(BROWSER_POOL_SIZE)
+
+    async def __aenter__(self):
+        # The browser itself is launched lazily, so checks answered by fast_probe() never start it.
+        self._pw = await async_playwright().start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._close_browser()
+        await self._pw.stop()
+
+    async def _launch(self):
+        print("Launching browser...")
+        # These arguments are crucial for running in a container like Render
+        self._browser = await self._pw.chromium.launch(
+            executable_path=CHROME_PATH,
+            headless=HEADLESS_MODE,
+            args=["--no-sandbox", "--disable-dev-shm-usage"],
+        )
+        self._uses = 0
+
+    async def _close_browser(self):
+        if self._browser is None:
+            return
+        try:
+            await self._browser.close()
+        except Exception:
+            # The browser may already be gone if it crashed.
+            pass
+        self._browser = None
+
+    async def _relaunch(self):
+        await self._close_browser()
+        await self._launch()
+
+    async def check_all(self, urls):
+        """Checks every URL concurrently and returns their statuses in the same order."""
+        # CAMPGROUND_ID describes a single campground, so the probe can only stand in for a single URL.
+        if len(urls) == 1:
+            # The probe uses blocking requests calls, so run it in a thread to keep the health check responsive.
+            status = await asyncio.to_thread(fast_probe)
+            if status is not None:
+                return [status]
+
+        # Only recycle between batches, when no page is using the browser.
+        if self._browser is None:
+            await self._launch()
+        elif not self._browser.is_connected() or self._uses >= BROWSER_RECYCLE_AFTER:
+            print("Recycling browser...")
+            await self._relaunch()
+        self._uses += len(urls)
+
+        return await asyncio.gather(*[self.check_availability(url) for url in urls])
+
+    async def check_availability(self, url):
+        """Checks one reservation page for site availability using robust Playwright locators."""
+        async with self._semaphore:
+            try:
+                context = await self._browser.new_context(
+                    user_agent=USER_AGENT,
+                    viewport={'width': 1920, 'height': 1080}
+                )
+            except PlaywrightError as e:
+                print(f"Could not open a browser context: {e}")
+                return 'FAILURE'
+
+            page = None
+            try:
+                await context.route("**/*", _block_unneeded_requests)
+                page = await context.new_page()
+
+                print(f"Navigating to reservation page: {url}")
+                await page.goto(url, wait_until="domcontentloaded", timeout=90000)
+
+                # Step 1: Wait for the main search component to be visible. This is our reliable "page loaded" check.
+                print(f"Waiting for main page component (ID: {PAGE_LOAD_CONFIRMATION_ID}) to load...")
+                await page.locator(f"#{PAGE_LOAD_CONFIRMATION_ID}").wait_for(state="visible", timeout=45000)
+                print("Main component loaded successfully.")
+
+                # Step 2: Click the 'List' view button using its unique ID.
+                print("Switching to List View...")
+                await page.locator(f"#{LIST_VIEW_BUTTON_ID}").click(timeout=45000)
+                print("List view button clicked successfully.")
+
+                # Step 3: Wait for whichever shows up first: the "No Available Sites" message or a campsite listing.
+                print("Waiting for the 'No Available Sites' message or a campsite listing...")
+                no_sites_locator = page.locator(f"xpath={NO_SITES_MESSAGE_XPATH}")
+                try:
+                    await no_sites_locator.or_(page.locator(SITE_LISTING_SELECTOR)).first.wait_for(state="visible", timeout=10000)
+                    # Only a rendered list is fingerprinted; one that is still loading would hash the same on every poll.
+                    fingerprint = await _results_fingerprint(page)
+                except PlaywrightTimeoutError:
+                    # Neither appeared in time, which is handled below the same as a listing appearing.
+                    fingerprint = None
+
+                if await no_sites_locator.is_visible():
+                    print(f"No sites available at {url}.")
+                    _remember_status(url, fingerprint, 'SUCCESS_NOT_FOUND')
+                    return 'SUCCESS_NOT_FOUND'
+
+                # The message is NOT on the page. This is our success case!
+                status = _found_status(url, fingerprint)
+                if status == 'SUCCESS_UNCHANGED':
+                    print(f"Sites are still available at {url}; they were already reported.")
+                else:
+                    print(f"SITES FOUND at {url}! The 'No Available Sites' message is gone!")
+                return status
+
+            except PlaywrightTimeoutError:
+                print("A timeout occurred. The page or a key component did not load in time.")
+                await _save_error_screenshot(page)
+                return 'FAILURE'
+            except TargetClosedError:
+                # The browser crashed mid-check; the next batch relaunches it.
+                print("The browser closed unexpectedly.")
+                return 'FAILURE'
+            except Exception as e:
+                print(f"An unexpected error occurred: {e}")
+                await _save_error_screenshot(page)
+                return 'FAILURE'
+            finally:
+                # Ensure the context is always closed to prevent resource leaks.
+                try:
+                    await context.close()
+                except PlaywrightError:
+                    pass
+
+
+async def run_loop():
+    """Checks TARGET_URLS on the next_check_delay() schedule and sends notifications until stopped."""
+    if not TARGET_URLS:
+        print("TARGET_URL is not set in the .env file. Cannot proceed.")
+        return
+
+    consecutive_failures = 0
+    async with Checker() as checker:
+        while True:
+            print(f"--- Starting availability check of {len(TARGET_URLS)} URL(s)... ---")
+            statuses = await checker.check_all(TARGET_URLS)
+
+            if 'FAILURE' in statuses:
+                consecutive_failures += 1
+                print(f"!!! Failure count: {consecutive_failures}/{MAX_CONSECUTIVE_FAILURES}")
+                if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                    print(f"!!! Reached {MAX_CONSECUTIVE_FAILURES} consecutive failures. Stopping checks.")
+                    failure_message = f"Campsite script stopped after {MAX_CONSECUTIVE_FAILURES} failed attempts to access the website."
+                    await send_pushover_notification(failure_message, title="Campsite Script Error")
+                    break
+            else:
+                consecutive_failures = 0
+
+            # 'SUCCESS_UNCHANGED' means the same open sites were already reported, so only new finds notify.
+            for url, status in zip(TARGET_URLS, statuses):
+                if status == 'SUCCESS_FOUND':
+                    notification_message = "A site may be available for your selected dates! Go book it now!"
+                    await send_pushover_notification(notification_message, url=url)
+
+            delay = next_check_delay(consecutive_failures)
+            print(f"--- Check complete. Waiting for {delay:.0f} seconds... ---")
+            await asyncio.sleep(delay)